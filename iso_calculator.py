@@ -4,23 +4,31 @@ This module implements a Flask application to help photographers calculate
 the correct aperture, shutter speed, or ISO based on the Sunny 16 rule and
 ambient light conditions.
 
+Performance: the calculation itself is a handful of lookups and one integer
+sum, so request cost is Python interpreter overhead, not computation or
+memory traffic. Everything that does not depend on the form (tables, labels,
+option tags and the compiled template) is therefore built once at import.
+GET requests are served the default page, pre-rendered at import. A POST
+does its lookups plus one Jinja render of the template, and that render is
+where most of its time goes. Vectorization or native code would not help.
+
 Dependencies:
 - Flask
-- Python's math module for calculations
 
 Author: Andreas jonsson
 Contact: ajdev8@gmail.com
 GitHub: https://github.com/sonofjon/sunny-16
 """
 
-import math
-
-from flask import Flask, render_template_string, request
+from flask import Flask, render_template, request
+from markupsafe import Markup
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import generate_etag
 
 app = Flask(__name__)
 
 # 1/3 stop ISO values
-iso_values = [
+iso_values = (
     100,
     125,
     160,
@@ -46,12 +54,11 @@ iso_values = [
     16000,
     20000,
     25600,
-]
-iso_labels = [f"{i}" for i in iso_values]
-# iso_options = list(zip(iso_values, iso_labels))
+)
+iso_labels = tuple(f"{i}" for i in iso_values)
 
 # 1/3 stop apertures
-apertures = [
+apertures = (
     1.4,
     1.6,
     1.8,
@@ -77,12 +84,11 @@ apertures = [
     18,
     20,
     22,
-]
-aperture_labels = [f"f/{a}" for a in apertures]
-# aperture_options = list(zip(apertures, aperture_labels))
+)
+aperture_labels = tuple(f"f/{a}" for a in apertures)
 
 # 1/3 stop shutter speeds
-shutter_speeds = [
+shutter_speeds = (
     1,
     1 / 1.3,
     1 / 1.6,
@@ -123,14 +129,60 @@ shutter_speeds = [
     1 / 5000,
     1 / 6400,
     1 / 8000,
-]
-shutter_speed_labels = [
-    "1" if s == 1
-    else f"1/{1/s:.2f}".rstrip("0").rstrip(".") if int(1 / s) != 1 / s
-    else f"1/{int(1/s)}"
-    for s in shutter_speeds
-]
-# shutter_speed_options = list(zip(shutter_speeds, shutter_speed_labels))
+)
+
+
+def shutter_speed_label(shutter_speed):
+    """Format a shutter speed as a fraction of a second.
+
+    Args:
+    ----
+        shutter_speed (float): The shutter speed in seconds, at most 1.
+
+    Returns:
+    -------
+        The label, e.g. "1", "1/1.3" or "1/125".
+
+    """
+    if shutter_speed == 1:
+        return "1"
+    # The general format drops trailing zeros, and the point for whole numbers
+    return f"1/{1 / shutter_speed:g}"
+
+
+shutter_speed_labels = tuple(shutter_speed_label(s) for s in shutter_speeds)
+
+# Position of each value in its 1/3 stop table. The tables start at ISO 100,
+# f/1.4 (one stop, or three 1/3 stops, above f/1) and 1 s, so in 1/3 stops
+# the Sunny 16 rule reads: aperture + shutter speed + 3 == 3 * EV + ISO
+iso_stops = {iso: i for i, iso in enumerate(iso_values)}
+aperture_stops = {a: i for i, a in enumerate(apertures)}
+shutter_speed_stops = {s: i for i, s in enumerate(shutter_speeds)}
+
+# Dropdown options for each stop increment (every third 1/3 stop value is a
+# full stop)
+stop_options = {
+    "full": {
+        "iso_options": tuple(zip(iso_values[::3], iso_labels[::3])),
+        "aperture_options": tuple(zip(apertures[::3], aperture_labels[::3])),
+        "shutter_speed_options": tuple(
+            zip(shutter_speeds[::3], shutter_speed_labels[::3])
+        ),
+    },
+    "third": {
+        "iso_options": tuple(zip(iso_values, iso_labels)),
+        "aperture_options": tuple(zip(apertures, aperture_labels)),
+        "shutter_speed_options": tuple(
+            zip(shutter_speeds, shutter_speed_labels)
+        ),
+    },
+}
+
+# Full stop values, to check the current selection against the full stop
+# dropdowns
+full_stop_iso_values = frozenset(iso_values[::3])
+full_stop_apertures = frozenset(apertures[::3])
+full_stop_shutter_speeds = frozenset(shutter_speeds[::3])
 
 light_conditions = {
     16: "Snow/Sand",
@@ -140,42 +192,97 @@ light_conditions = {
     12: "Heavy Overcast",
     11: "Open Shade/Sunset",
 }
-ev_options = [
+ev_options = tuple(
     (ev, f"EV {ev}: {light_conditions[ev]}")
     for ev in sorted(light_conditions.keys(), reverse=True)
-]
+)
 
+# Each setting keyed by the string its dropdown posts, so that submitted
+# values are looked up instead of parsed. Values that are not in the
+# dropdowns fall back to the defaults.
+iso_from_form = {str(iso): iso for iso in iso_values}
+aperture_from_form = {str(a): a for a in apertures}
+shutter_speed_from_form = {str(s): s for s in shutter_speeds}
+ev_from_form = {str(ev): ev for ev in light_conditions}
 
-def find_nearest(possible_values, target_value):
-    """Find the closest value in a list to the given target value.
+
+def option_tags(options):
+    """Render the <option> tags of a dropdown for every possible selection.
 
     Args:
     ----
-        possible_values (list): A list of possible numeric values.
-        target_value (float): The value to find the closest match to.
+        options (tuple): The (value, label) pairs of the dropdown.
 
     Returns:
     -------
-        The value from possible_values that is closest to target_value.
+        A dict mapping each value to the option tags with that value
+        selected, and None to the tags with no value selected.
 
     """
-    return min(possible_values, key=lambda x: abs(x - target_value))
+    tags = {
+        None: Markup("\n").join(
+            Markup('<option value="{}">{}</option>').format(value, label)
+            for value, label in options
+        )
+    }
+    for selected, _ in options:
+        tags[selected] = Markup("\n").join(
+            Markup('<option value="{}"{}>{}</option>').format(
+                value, Markup(" selected") if value == selected else "", label
+            )
+            for value, label in options
+        )
+    return tags
 
 
-def to_fraction(shutter_speed):
-    """Convert a shutter speed number to a human-readable fraction string.
+def select_option(tags, value):
+    """Return the option tags of a dropdown with the given value selected.
 
     Args:
     ----
-        shutter_speed (float): A numeric value representing the shutter speed.
+        tags (dict): Option tags as returned by option_tags.
+        value: The selected value.
 
     Returns:
     -------
-        A string representation of the shutter speed in the form of a fraction.
+        The option tags, with nothing selected if value is not an option.
 
     """
-    index = shutter_speeds.index(shutter_speed)
-    return shutter_speed_labels[index] if index >= 0 else "Unknown speed"
+    return tags.get(value, tags[None])
+
+
+# Rendered option tags of each dropdown, for each stop increment
+stop_option_tags = {
+    stop_choice: {name: option_tags(opts) for name, opts in options.items()}
+    for stop_choice, options in stop_options.items()
+}
+ev_option_tags = option_tags(ev_options)
+
+
+# Calculation for each valid combination of locks on (aperture, shutter
+# speed, ISO): the result key, the results for each stop of the unlocked
+# variable, its stop given the (aperture, shutter speed, ISO, 3 * EV) stops
+# and the warning for stops outside the table
+calculations = {
+    (False, True, True): (
+        "Aperture",
+        apertures,
+        lambda a, s, i, ev: ev + i - s - 3,
+        "Calculated aperture is out of range.",
+    ),
+    (True, False, True): (
+        "Shutter Speed",
+        shutter_speed_labels,
+        lambda a, s, i, ev: ev + i - a - 3,
+        "Calculated shutter speed is out of range.",
+    ),
+    (True, True, False): (
+        "ISO",
+        iso_values,
+        lambda a, s, i, ev: a + s + 3 - ev,
+        "Calculated ISO is out of range.",
+    ),
+}
 
 
 HTML_TEMPLATE = """
@@ -211,9 +318,7 @@ HTML_TEMPLATE = """
         <div class="col-md-6">
           <label for="ev" class="form-label">Exposure Value:</label>
           <select name="ev" id="ev" class="form-select" required>
-            {% for value, description in ev_options %}
-            <option value="{{ value }}" {{ 'selected' if value == ev }}>{{ description }}</option>
-            {% endfor %}
+            {{ ev_options }}
           </select>
         </div>
 
@@ -221,9 +326,7 @@ HTML_TEMPLATE = """
         <div class="col-md-6">
           <label for="iso" class="form-label">ISO:</label>
           <select name="iso" id="iso" class="form-select">
-            {% for i, label in iso_options %}
-            <option value="{{ i }}" {{ 'selected' if i == iso }}>{{ label }}</option>
-            {% endfor %}
+            {{ iso_options }}
           </select>
           <input type="checkbox" name="lock_iso" {{ 'checked' if lock_iso }}> Lock
         </div>
@@ -232,9 +335,7 @@ HTML_TEMPLATE = """
         <div class="col-md-6">
           <label for="aperture" class="form-label">Aperture:</label>
           <select name="aperture" id="aperture" class="form-select">
-            {% for a, label in aperture_options %}
-            <option value="{{ a }}" {{ 'selected' if a == aperture }}>{{ label }}</option>
-            {% endfor %}
+            {{ aperture_options }}
           </select>
           <input type="checkbox" name="lock_aperture" {{ 'checked' if lock_aperture }}> Lock
         </div>
@@ -243,9 +344,7 @@ HTML_TEMPLATE = """
         <div class="col-md-6">
           <label for="shutterspeed" class="form-label">Shutter Speed:</label>
           <select name="shutterspeed" id="shutterspeed" class="form-select">
-            {% for speed, label in shutter_speed_options %}
-            <option value="{{ speed }}" {{ 'selected' if speed == shutterspeed }}>{{ label }}</option>
-            {% endfor %}
+            {{ shutter_speed_options }}
           </select>
           <input type="checkbox" name="lock_shutterspeed" {{ 'checked' if lock_shutter_speed }}> Lock
         </div>
@@ -277,6 +376,101 @@ HTML_TEMPLATE = """
 </body>
 </html>
 """
+COMPILED_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+
+defaults = {
+    "aperture": 16.0,
+    "shutterspeed": 1 / 125,
+    "iso": 100,
+    "ev": 15,
+}
+
+
+def read_form(form):
+    """Read the calculator settings from the submitted form.
+
+    Args:
+    ----
+        form (dict): The submitted form fields. Missing fields take their
+            default values.
+
+    Returns:
+    -------
+        A dict with the stop increment, settings, locks and empty result
+        fields.
+
+    """
+    get = form.get
+    stop_choice = get("stop_increment", "full")
+    if stop_choice not in stop_options:
+        stop_choice = "full"
+
+    data = {
+        "stop_choice": stop_choice,
+        "aperture": aperture_from_form.get(
+            get("aperture"), defaults["aperture"]
+        ),
+        "shutterspeed": shutter_speed_from_form.get(
+            get("shutterspeed"), defaults["shutterspeed"]
+        ),
+        "iso": iso_from_form.get(get("iso"), defaults["iso"]),
+        "ev": ev_from_form.get(get("ev"), defaults["ev"]),
+        "lock_aperture": "lock_aperture" in form,
+        "lock_shutter_speed": "lock_shutterspeed" in form,
+        "lock_iso": "lock_iso" in form,
+        "result": None,
+        "result_key": "",
+        "error": "",
+        "warning": "",
+    }
+
+    # Selections that are not full stops are missing from the full stop
+    # dropdowns, so fall back to the defaults when switching to full stops
+    if stop_choice == "full":
+        if data["iso"] not in full_stop_iso_values:
+            data["iso"] = defaults["iso"]
+        if data["aperture"] not in full_stop_apertures:
+            data["aperture"] = defaults["aperture"]
+        if data["shutterspeed"] not in full_stop_shutter_speeds:
+            data["shutterspeed"] = defaults["shutterspeed"]
+
+    return data
+
+
+def render_page(data):
+    """Render the calculator page.
+
+    Args:
+    ----
+        data (dict): The stop increment, settings, locks and result fields
+            to display.
+
+    Returns:
+    -------
+        The rendered HTML page.
+
+    """
+    tags = stop_option_tags[data["stop_choice"]]
+    return render_template(
+        COMPILED_TEMPLATE,
+        **data,
+        ev_options=select_option(ev_option_tags, data["ev"]),
+        iso_options=select_option(tags["iso_options"], data["iso"]),
+        aperture_options=select_option(
+            tags["aperture_options"], data["aperture"]
+        ),
+        shutter_speed_options=select_option(
+            tags["shutter_speed_options"], data["shutterspeed"]
+        ),
+    )
+
+
+# GET requests carry no form data, so the page they get never changes and is
+# rendered once at startup. Its ETag lets browsers revalidate it with a 304.
+with app.app_context():
+    default_page = render_page(read_form({}))
+default_page_etag = generate_etag(default_page.encode())
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -284,10 +478,11 @@ def calculate_variable():
     """Calculate the photography settings based on the Sunny 16 rule.
 
     This route handles both GET and POST requests. On a GET request, it
-    renders the form with default settings. On a POST request, it computes
+    returns the form with default settings. On a POST request, it computes
     either the aperture, shutter speed, or ISO depending on which two
-    parameters are locked by the user. Errors are returned if input is
-    invalid or if the precise locking mechanism isn't followed.
+    parameters are locked by the user. Submitted values that are not in the
+    dropdowns fall back to the defaults, so the only error returned is for
+    not locking exactly two parameters.
 
     Returns:
     -------
@@ -295,115 +490,71 @@ def calculate_variable():
         results, warnings, or error messages.
 
     """
-    stop_choice = request.form.get("stop_increment", "full")
-    if stop_choice == "full":
-        iso_options = list(zip(iso_values[::3], iso_labels[::3]))
-        aperture_options = list(zip(apertures[::3], aperture_labels[::3]))
-        shutter_speed_options = list(
-            zip(shutter_speeds[::3], shutter_speed_labels[::3])
+    if request.method != "POST":
+        response = app.make_response(default_page)
+        response.set_etag(default_page_etag)
+        return response.make_conditional(request)
+
+    data = read_form(request.form)
+
+    # Only combinations with exactly two locks have a calculation
+    calculation = calculations.get(
+        (data["lock_aperture"], data["lock_shutter_speed"], data["lock_iso"])
+    )
+    if calculation is None:
+        data["error"] = (
+            "Please lock exactly two variables to calculate the third."
         )
     else:
-        iso_options = list(zip(iso_values, iso_labels))
-        aperture_options = list(zip(apertures, aperture_labels))
-        shutter_speed_options = list(
-            zip(shutter_speeds, shutter_speed_labels)
+        result_key, results, calculate_stop, warning = calculation
+        stop = calculate_stop(
+            aperture_stops[data["aperture"]],
+            shutter_speed_stops[data["shutterspeed"]],
+            iso_stops[data["iso"]],
+            3 * data["ev"],
         )
+        if not 0 <= stop < len(results):
+            data["warning"] = warning
+        else:
+            data["result"] = results[stop]
+            data["result_key"] = result_key
 
-    defaults = {
-        "aperture": 16.0,
-        "shutterspeed": 1 / 125,
-        "iso": 100,
-        "ev": 15,
-    }
+    return render_page(data)
 
-    data = {
-        "aperture": float(request.form.get("aperture", defaults["aperture"])),
-        "shutterspeed": float(
-            request.form.get("shutterspeed", defaults["shutterspeed"])
-        ),
-        "iso": int(request.form.get("iso", defaults["iso"])),
-        "ev": int(request.form.get("ev", defaults["ev"])),
-        "lock_aperture": "lock_aperture" in request.form,
-        "lock_shutter_speed": "lock_shutterspeed" in request.form,
-        "lock_iso": "lock_iso" in request.form,
-        "result": None,
-        "result_key": "",
-        "error": "",
-        "warning": "",
-    }
 
-    if request.method == "POST":
-        locks = [
-            data["lock_aperture"],
-            data["lock_shutter_speed"],
-            data["lock_iso"],
-        ]
-        if sum(locks) != 2:
-            data["error"] = (
-                "Please lock exactly two variables to calculate the third."
-            )
-        else:
-            try:
-                if not data["lock_aperture"]:
-                    calculated_aperture = math.sqrt(
-                        (data["iso"] / 100)
-                        * (2 ** data["ev"])
-                        * data["shutterspeed"]
-                    )
-                    if calculated_aperture < min(
-                        apertures
-                    ) or calculated_aperture > max(apertures):
-                        data["warning"] = (
-                            "Calculated aperture is out of range."
-                        )
-                    else:
-                        data["result"] = find_nearest(
-                            apertures, calculated_aperture
-                        )
-                        data["result_key"] = "Aperture"
-                elif not data["lock_shutter_speed"]:
-                    calculated_speed = (data["aperture"] ** 2) / (
-                        (2 ** data["ev"]) * (data["iso"] / 100)
-                    )
-                    if calculated_speed < min(
-                        shutter_speeds
-                    ) or calculated_speed > max(shutter_speeds):
-                        data["warning"] = (
-                            "Calculated shutter speed is out of range."
-                        )
-                    else:
-                        data["result"] = to_fraction(
-                            find_nearest(shutter_speeds, calculated_speed)
-                        )
-                        data["result_key"] = "Shutter Speed"
-                elif not data["lock_iso"]:
-                    calculated_iso = (
-                        100
-                        * ((data["aperture"] ** 2) / data["shutterspeed"])
-                        / (2 ** data["ev"])
-                    )
-                    if calculated_iso < min(
-                        iso_values
-                    ) or calculated_iso > max(iso_values):
-                        data["warning"] = "Calculated ISO is out of range."
-                    else:
-                        data["result"] = find_nearest(
-                            iso_values, calculated_iso
-                        )
-                        data["result_key"] = "ISO"
-            except ValueError as e:
-                data["error"] = f"Invalid input: {e}"
-
-    return render_template_string(
-        HTML_TEMPLATE,
-        **data,
-        stop_choice=stop_choice,
-        aperture_options=aperture_options,
-        shutter_speed_options=shutter_speed_options,
-        iso_options=iso_options,
-        ev_options=ev_options,
+@app.errorhandler(Exception)
+def handle_exception(e):
+    """Render unexpected errors on the calculator page.
+
+    HTTP errors (such as 404 or 405) are passed through unchanged. Other
+    exceptions are re-raised when Flask would propagate them (in debug or
+    testing mode, or if PROPAGATE_EXCEPTIONS is set) so they reach the
+    debugger or the test client. Otherwise they are logged and shown as an
+    error on a page with default settings, instead of a bare 500 page.
+
+    Args:
+    ----
+        e (Exception): The unhandled exception.
+
+    Returns:
+    -------
+        The HTTP error, or the rendered HTML page with status 500.
+
+    """
+    if isinstance(e, HTTPException):
+        return e
+    propagate = app.config["PROPAGATE_EXCEPTIONS"]
+    if propagate is None:
+        propagate = app.testing or app.debug
+    if propagate:
+        raise
+    app.logger.error(
+        f"Exception on {request.path} [{request.method}]", exc_info=e
     )
+    data = read_form({})
+    data["error"] = "Something went wrong. Please try again."
+    return render_page(data), 500
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run()
@@ -1,16 +1,13 @@
-import pandas as pd
 import numpy as np
 
 def calculate_iso(f_number, shutter_speed, exposure_value):
-    # Calculate  ISO value
-    iso = (100 * (f_number ** 2)) / (shutter_speed * (2 ** exposure_value))
-    # Return values greater than 50
-    return iso if iso >= 50 else np.nan
+    # Calculate  ISO value (element-wise for arrays)
+    return (100 * (f_number ** 2)) / (shutter_speed * (2.0 ** exposure_value))
 
 # Standard ISO values (1/3 step increments)
-iso_standard_values = [ 50, 100, 125, 160, 200, 250, 320, 400, 500, 640, 800, 1000,
-                        1250, 1600, 2000, 2500, 3200, 4000, 5000, 6400, 8000, 10000,
-                        12800, 16000, 20000, 25600, 32000, 40000, 51200, 102400 ]
+iso_standard_values = np.array([ 50, 100, 125, 160, 200, 250, 320, 400, 500, 640, 800, 1000,
+                                 1250, 1600, 2000, 2500, 3200, 4000, 5000, 6400, 8000, 10000,
+                                 12800, 16000, 20000, 25600, 32000, 40000, 51200, 102400 ])
 
 # Exposure (EV) values
 exposure_values = [11, 12, 13, 14, 15, 16]
@@ -18,22 +15,18 @@ exposure_values = [11, 12, 13, 14, 15, 16]
 # Shutter speeds
 shutter_speeds = [1/4000, 1/2000, 1/1000, 1/500, 1/250, 1/125, 1/60, 1/30]
 
-# Create a DataFrame to store the ISO values
-df = pd.DataFrame(columns=exposure_values)
+# Calculate the ISO values for all shutter speeds (rows) and EV values (columns)
+iso = calculate_iso(f_number=16,
+                    shutter_speed=np.array(shutter_speeds)[:, np.newaxis],
+                    exposure_value=np.array(exposure_values)[np.newaxis, :])
 
-for ev in exposure_values:
-    iso_values = []
-    for s in shutter_speeds:
-        iso = calculate_iso(f_number=16, shutter_speed=s, exposure_value=ev)
-
-        # Find the nearest ISO value in the standard array
-        nearest_iso = min(iso_standard_values, key=lambda x: abs(x - iso))
-
-        # Store the nearest ISO value in the list
-        iso_values.append(nearest_iso)
-
-    # Add the ISO values for the current EV value to the DataFrame
-    df[ev] = iso_values
+# Find the nearest ISO value in the standard array, by comparing the standard
+# values on either side of each ISO value (values below 50 snap to 50)
+index = np.clip(np.searchsorted(iso_standard_values, iso),
+                1, len(iso_standard_values) - 1)
+lower = iso_standard_values[index - 1]
+upper = iso_standard_values[index]
+nearest_iso = np.where(iso - lower <= upper - iso, lower, upper)
 
 # Define lighting conditions mapped to EV values
 lighting_conditions = {
@@ -45,8 +38,10 @@ lighting_conditions = {
     16: "Open Shade/Sunset"
 }
 
-# Rename the columns using the lighting conditions
-df.rename(columns=lighting_conditions, inplace=True)
-
-# Print the DataFrame
-print(df)
+# Print the ISO values, one row per shutter speed and one column per lighting
+# condition
+headers = [lighting_conditions[ev] for ev in exposure_values]
+print(" " * 6, "  ".join(headers))
+for s, row in zip(shutter_speeds, nearest_iso):
+    print(f"1/{round(1 / s):<4d}",
+          "  ".join(f"{value:>{len(h)}d}" for value, h in zip(row, headers)))